@@ -0,0 +1,124 @@
+"""Stub `oc`/`bonfire` binary emulating an ephemeral namespace.
+
+Installed into PATH by `fakes.install_stubs`, configured with `BENCH_*` env vars:
+
+    BENCH_PODS          number of pods in the namespace
+    BENCH_CONTAINERS    containers per pod
+    BENCH_LOG_KB        size of each container log in KiB
+    BENCH_LATENCY       seconds to sleep on every call
+    BENCH_CALLS         file where every call and its output size is recorded
+"""
+import base64
+import json
+import os
+import sys
+import time
+from typing import Dict
+from typing import List
+
+PODS = int(os.getenv("BENCH_PODS", "5"))
+CONTAINERS = int(os.getenv("BENCH_CONTAINERS", "2"))
+LOG_KB = int(os.getenv("BENCH_LOG_KB", "256"))
+LATENCY = float(os.getenv("BENCH_LATENCY", "0"))
+CALLS = os.getenv("BENCH_CALLS", "")
+
+
+def _option(args: List[str], name: str, default: str = "") -> str:
+    for i, arg in enumerate(args):
+        if arg == name and i + 1 < len(args):
+            return args[i + 1]
+        if arg.startswith(f"{name}="):
+            return arg.split("=", 1)[1]
+    return default
+
+
+def _pod(i: int) -> Dict:
+    containers = [{"name": f"container-{j}"} for j in range(CONTAINERS)]
+    return {
+        "kind": "Pod",
+        "metadata": {"name": f"app-{i}-7d9f8c-x{i}"},
+        "spec": {"containers": containers},
+        "status": {
+            "phase": "Running",
+            "containerStatuses": [
+                {"name": c["name"], "state": {"running": {}}} for c in containers
+            ],
+        },
+    }
+
+
+def _deployment(i: int) -> Dict:
+    return {
+        "kind": "Deployment",
+        "metadata": {"name": f"app-{i}", "generation": 1},
+        "spec": {"replicas": 1},
+        "status": {"readyReplicas": 1, "observedGeneration": 1},
+    }
+
+
+def _secret(name: str, data: Dict[str, str]) -> Dict:
+    return {
+        "kind": "Secret",
+        "metadata": {"name": name},
+        "data": {k: base64.b64encode(v.encode()).decode() for k, v in data.items()},
+    }
+
+
+def _log(since: str = "") -> bytes:
+    """Log with `--timestamps`, like the kubelet only lines at or after `since`."""
+    line_size = 128
+    lines = []
+    for i in range(LOG_KB * 1024 // line_size):
+        timestamp = f"2022-01-01T{i // 3600000 % 24:02d}:{i // 60000 % 60:02d}:"
+        timestamp += f"{i // 1000 % 60:02d}.{i % 1000:03d}Z"
+        # all timestamps have the same format, so they compare as strings
+        if timestamp < since:
+            continue
+        lines.append(f"{timestamp} {'x' * (line_size - len(timestamp) - 2)}\n")
+    return "".join(lines).encode()
+
+
+def oc(args: List[str]) -> bytes:
+    ns = _option(args, "--namespace", "bench")
+    if args[0] == "get":
+        resource = args[1]
+        if resource in ("pods", "pod"):
+            return json.dumps({"items": [_pod(i) for i in range(PODS)]}).encode()
+        if resource == "deployments,pods":
+            items = [_deployment(i) for i in range(PODS)] + [_pod(i) for i in range(PODS)]
+            return json.dumps({"items": items}).encode()
+        if resource == "secret":
+            secrets = [
+                _secret(f"env-{ns}-minio", {"accessKey": "access", "secretKey": "secret"}),
+                _secret("app", {"cdappconfig.json": json.dumps({"database": {"name": "db"}})}),
+            ]
+            return json.dumps({"kind": "List", "items": secrets}).encode()
+        return b"kind: List\nitems:\n" + b"- metadata: {}\n" * 1000
+    if args[0] == "logs":
+        if "--previous" in args:
+            sys.stderr.write("previous terminated container not found\n")
+            sys.exit(1)
+        return _log(_option(args, "--since-time"))
+    return b""
+
+
+def bonfire(args: List[str]) -> bytes:
+    if args[0] == "deploy-iqe-cji":
+        return b"iqe-pod-bench\n"
+    if args[:2] == ["namespace", "reserve"]:
+        return b"bench\n"
+    return b""
+
+
+def main() -> None:
+    name, args = sys.argv[1], sys.argv[2:]
+    time.sleep(LATENCY)
+    output = oc(args) if name == "oc" else bonfire(args)
+    if CALLS:
+        with open(CALLS, "a") as f:
+            f.write(json.dumps({"cmd": [name, *args], "bytes": len(output)}) + "\n")
+    sys.stdout.buffer.write(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Latency-configurable fakes of the container engine, registry and MinIO."""
+import io
+import os
+import stat
+import sys
+import tarfile
+import time
+from pathlib import Path
+from typing import Any
+from typing import Dict
+from typing import Iterator
+from typing import Tuple
+
+import attr
+
+STUB = Path(__file__).parent / "fake_oc.py"
+
+
+def install_stubs(bin_dir: Path, env: Dict[str, str]) -> None:
+    """Put stub `oc` and `bonfire` binaries first in PATH."""
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    for name in ("oc", "bonfire"):
+        binary = bin_dir / name
+        binary.write_text(f'#!/bin/sh\nexec {sys.executable} {STUB} {name} "$@"\n')
+        binary.chmod(binary.stat().st_mode | stat.S_IEXEC)
+    os.environ.update(env)
+    os.environ["PATH"] = f"{bin_dir}{os.pathsep}{os.environ['PATH']}"
+
+
+@attr.s
+class Stats:
+    calls: int = attr.ib(default=0)
+    bytes: int = attr.ib(default=0)
+
+
+@attr.s
+class FakeImage:
+    id: str = attr.ib()
+
+
+@attr.s
+class FakeRegistry:
+    """Image API of the engine backed by a fake registry with fixed layer size."""
+
+    stats: Stats = attr.ib()
+    latency: float = attr.ib(default=0.0)
+    layer_size: int = attr.ib(default=50 * 1024 * 1024)
+
+    def _transfer(self) -> None:
+        time.sleep(self.latency)
+        self.stats.calls += 1
+        self.stats.bytes += self.layer_size
+
+    def pull(self, repository: str, tag: str = None, all_tags: bool = False, **kwargs: Any):
+        self._transfer()
+        return FakeImage(f"{repository}:{tag or 'latest'}")
+
+    def push(self, repository: str, tag: str = None, **kwargs: Any) -> str:
+        self._transfer()
+        return ""
+
+    def build(self, path: str, tag: str, dockerfile: str, **kwargs: Any):
+        time.sleep(self.latency)
+        self.stats.calls += 1
+        return FakeImage(tag), iter([b"STEP 1/1"])
+
+
+@attr.s
+class FakeMinioContainer:
+    """`mc` container holding artifacts mirrored from a fake MinIO bucket."""
+
+    stats: Stats = attr.ib()
+    junit_files: int = attr.ib(default=10)
+    junit_kb: int = attr.ib(default=512)
+
+    def get_archive(self, path: str) -> Tuple[Iterator[bytes], Dict[str, Any]]:
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode="w") as tf:
+            for i in range(self.junit_files):
+                data = b"<testsuite>" + b"x" * self.junit_kb * 1024 + b"</testsuite>"
+                info = tarfile.TarInfo(f"junit-{i}.xml")
+                info.size = len(data)
+                tf.addfile(info, io.BytesIO(data))
+        self.stats.bytes += buf.tell()
+        buf.seek(0)
+        return iter(lambda: buf.read(64 * 1024), b""), {}
+
+
+@attr.s
+class FakeContainers:
+    stats: Stats = attr.ib()
+    latency: float = attr.ib(default=0.0)
+
+    def run(self, image: str, command: str, **kwargs: Any) -> bytes:
+        time.sleep(self.latency)
+        self.stats.calls += 1
+        return b""
+
+    def get(self, name: str) -> FakeMinioContainer:
+        return FakeMinioContainer(self.stats)
+
+
+@attr.s
+class FakeEngine:
+    """Stand-in for the podman/docker client used by `ContainerClient`."""
+
+    latency: float = attr.ib(default=0.0)
+    stats: Stats = attr.ib(factory=Stats)
+    images: FakeRegistry = attr.ib(init=False)
+    containers: FakeContainers = attr.ib(init=False)
+
+    def __attrs_post_init__(self) -> None:
+        self.images = FakeRegistry(self.stats, self.latency)
+        self.containers = FakeContainers(self.stats, self.latency)
+
+    def login(self, **kwargs: Any) -> Dict[str, Any]:
+        return {}
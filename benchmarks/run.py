@@ -0,0 +1,223 @@
+"""Benchmark teardown, smoke tests, image builds and pulls against fake backends.
+
+Every scenario runs in a fresh interpreter with stub `oc`/`bonfire` binaries
+in PATH and a fake container engine, registry and MinIO. Wall time,
+subprocess count, peak RSS and bytes transferred are stored as JSON, e.g.:
+
+    python benchmarks/run.py --pods 20 --containers 3 --log-kb 1024 --latency 0.05
+    python benchmarks/run.py --compare benchmarks/results/0.1.0.json
+"""
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+from typing import Callable
+from typing import Dict
+
+import click
+
+from fakes import FakeEngine
+from fakes import install_stubs
+
+ROOT = Path(__file__).resolve().parents[1]
+RESULTS_DIR = Path(__file__).parent / "results"
+METRICS = ("wall_time", "subprocesses", "peak_rss_kb", "bytes_transferred")
+
+
+def _container_client(engine: FakeEngine):
+    from bonfire_cicd.clients.container import ContainerClient
+
+    # skip engine detection, it would spawn `which podman` and connect to a socket
+    client = ContainerClient.__new__(ContainerClient)
+    client.base_url = None
+    client.auth = {}
+    client.client = engine
+    return client
+
+
+def _oc_client():
+    from bonfire_cicd.clients.openshift import OpenshiftClient
+
+    return OpenshiftClient("token", "https://api.bench:6443")
+
+
+def teardown(engine: FakeEngine, workdir: Path, runs: int = 1) -> None:
+    from bonfire_cicd.utils import teardown as _teardown
+
+    oc = _oc_client()
+    for _ in range(runs):
+        _teardown(oc, "bench")
+
+
+def teardown_rerun(engine: FakeEngine, workdir: Path) -> None:
+    teardown(engine, workdir, runs=2)
+
+
+def smoke_tests(engine: FakeEngine, workdir: Path) -> None:
+    from bonfire_cicd.smoke_tests import SmokeTestRunner
+
+    runner = SmokeTestRunner(
+        oc=_oc_client(),
+        docker=_container_client(engine),
+        cji_name="app",
+        cji_timeout="30m",
+        namespace="bench",
+        job_name="bench",
+        build_number="1",
+        iqe_marker="",
+        iqe_filter="",
+        iqe_plugins="",
+        artifacts_dir=str(workdir / "artifacts"),
+    )
+    runner.deploy_iqe_cji()
+
+
+def image_build(engine: FakeEngine, workdir: Path) -> None:
+    from bonfire_cicd.build import ImageBuilder
+
+    app_root = workdir / "app"
+    app_root.mkdir()
+    (app_root / "Dockerfile").write_text("FROM registry.bench/base:latest\n")
+    builder = ImageBuilder(
+        client=_container_client(engine),
+        image="registry.bench/app",
+        image_tag="bench",
+        app_root=str(app_root),
+        quay_api_token="",
+        cache_from_latest=True,
+    )
+    builder.build()
+    builder.push()
+
+
+def image_pull(engine: FakeEngine, workdir: Path) -> None:
+    client = _container_client(engine)
+    for i in range(10):
+        client.pull("registry.bench/app", f"tag-{i}")
+
+
+SCENARIOS: Dict[str, Callable[[FakeEngine, Path], None]] = {
+    "teardown": teardown,
+    "teardown_rerun": teardown_rerun,
+    "smoke_tests": smoke_tests,
+    "image_build": image_build,
+    "image_pull": image_pull,
+}
+
+
+def run_scenario(name: str, config: Dict[str, Any]) -> Dict[str, Any]:
+    """Run a single scenario in this process, meant to be called in a fresh interpreter."""
+    workdir = Path(tempfile.mkdtemp(prefix=f"bench-{name}-"))
+    calls_file = workdir / "calls.jsonl"
+    install_stubs(
+        workdir / "bin",
+        {
+            "BENCH_PODS": str(config["pods"]),
+            "BENCH_CONTAINERS": str(config["containers"]),
+            "BENCH_LOG_KB": str(config["log_kb"]),
+            "BENCH_LATENCY": str(config["latency"]),
+            "BENCH_CALLS": str(calls_file),
+            "K8S_ARTIFACTS_DIR": str(workdir / "k8s_artifacts"),
+            "RELEASE_NAMESPACE": "false",
+            # teardown keeps log checkpoints of the same run only
+            "JOB_NAME": "bench",
+            "BUILD_NUMBER": "1",
+            "IMAGE_CACHE_STATE": str(workdir / "images.json"),
+        },
+    )
+    sys.path.insert(0, str(ROOT))
+    engine = FakeEngine(latency=config["latency"])
+
+    start = time.perf_counter()
+    SCENARIOS[name](engine, workdir)
+    wall_time = time.perf_counter() - start
+
+    calls = []
+    if calls_file.exists():
+        calls = [json.loads(line) for line in calls_file.read_text().splitlines()]
+    return {
+        "wall_time": round(wall_time, 3),
+        "subprocesses": len(calls),
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "bytes_transferred": sum(call["bytes"] for call in calls) + engine.stats.bytes,
+    }
+
+
+def _version() -> str:
+    try:
+        from importlib.metadata import version
+
+        return version("bonfire_cicd")
+    except Exception:
+        return "dev"
+
+
+def _compare(results: Dict[str, Any], baseline_file: str) -> None:
+    baseline = json.loads(Path(baseline_file).read_text())["results"]
+    for name, metrics in results.items():
+        if name not in baseline:
+            continue
+        for metric in METRICS:
+            old, new = baseline[name][metric], metrics[metric]
+            change = (new - old) / old * 100 if old else 0.0
+            click.echo(f"{name:16} {metric:18} {old:>14} -> {new:>14} ({change:+.1f}%)")
+
+
+@click.command()
+@click.option("--scenario", "-s", multiple=True, type=click.Choice(list(SCENARIOS)))
+@click.option("--pods", default=10, show_default=True)
+@click.option("--containers", default=2, show_default=True)
+@click.option("--log-kb", default=256, show_default=True, help="size of each container log")
+@click.option("--latency", default=0.0, show_default=True, help="seconds added to every call")
+@click.option("--output", "-o", type=click.Path(), help="defaults to results/<version>.json")
+@click.option("--compare", type=click.Path(exists=True), help="results file to compare with")
+@click.option("--child", hidden=True)
+def main(scenario, pods, containers, log_kb, latency, output, compare, child):
+    config = {"pods": pods, "containers": containers, "log_kb": log_kb, "latency": latency}
+    if child:
+        click.echo(json.dumps(run_scenario(child, config)))
+        return
+
+    results = {}
+    failed = []
+    for name in scenario or SCENARIOS:
+        args = [sys.executable, __file__, "--child", name, "--pods", str(pods)]
+        args += ["--containers", str(containers), "--log-kb", str(log_kb)]
+        args += ["--latency", str(latency)]
+        try:
+            proc = subprocess.run(args, check=True, capture_output=True, text=True)
+        except subprocess.CalledProcessError as err:
+            # keep benchmarking the other scenarios
+            click.echo(f"{name}: failed with exit code {err.returncode}\n{err.stderr}", err=True)
+            failed.append(name)
+            continue
+        results[name] = json.loads(proc.stdout.splitlines()[-1])
+        click.echo(f"{name}: {results[name]}")
+
+    output_file = Path(output) if output else RESULTS_DIR / f"{_version()}.json"
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    output_file.write_text(
+        json.dumps(
+            {
+                "version": _version(),
+                "timestamp": time.time(),
+                "config": config,
+                "results": results,
+                "failed": failed,
+            },
+            indent=2,
+        )
+    )
+    click.echo(f"Results stored in {output_file}")
+    if compare:
+        _compare(results, compare)
+    if failed:
+        raise click.ClickException(f"failed scenarios: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,19 @@
 import os
+from pathlib import Path
 
 import click
 from distutils.util import strtobool
 
 from .build import ImageBuilder
+from .clients.container import dockerfile_base_images
+from .clients.executor import executor
 from .deploy import EphemeralDeployer
 from .deploy import EphemeralDeployerDB
+from .smoke_tests import MC_IMAGE
 from .smoke_tests import SmokeTestRunner
 from .utils import Clients
+from .utils import parse_size
+from .utils import snapshot_pod_logs
 from .utils import teardown
 
 IMAGE = os.getenv("IMAGE", "")
@@ -24,6 +30,8 @@ PR_ID = os.getenv("ghprbPullId") or os.getenv("gitlabMergeRequestIid")
 DOCKERFILE = os.getenv("DOCKERFILE", "Dockerfile")
 CACHE_FROM_LATEST_IMAGE = os.getenv("CACHE_FROM_LATEST_IMAGE", "false")
 
+IMAGE_CACHE_BUDGET = os.getenv("IMAGE_CACHE_BUDGET", "20G")
+
 OC_LOGIN_TOKEN = os.getenv("OC_LOGIN_TOKEN", "")
 OC_LOGIN_SERVER = os.getenv("OC_LOGIN_SERVER", "")
 
@@ -51,11 +59,23 @@ IQE_REQUIREMENTS_PRIORITY = os.getenv("IQE_REQUIREMENTS_PRIORITY", "")
 IQE_TEST_IMPORTANCE = os.getenv("IQE_TEST_IMPORTANCE", "")
 IQE_PLUGINS = os.getenv("IQE_PLUGINS", "")
 IQE_CJI_TIMEOUT = os.getenv("IQE_CJI_TIMEOUT", "30m")
+IQE_SHARDS = os.getenv("IQE_SHARDS", "1")
+IQE_SHARD_BY = os.getenv("IQE_SHARD_BY", "plugin")
+IQE_SHARD_MARKERS = os.getenv("IQE_SHARD_MARKERS", "")
+IQE_SHARD_TESTS = os.getenv("IQE_SHARD_TESTS", "")
+IQE_DURATION_INDEX = os.getenv("IQE_DURATION_INDEX", "")
 
 
 @click.group("cicd")
+@click.option(
+    "--dry-run",
+    is_flag=True,
+    help="Don't run any commands, print the planned commands with estimated cost",
+)
 @click.pass_context
-def main(ctx):
+def main(ctx, dry_run):
+    executor.dry_run = dry_run
+    ctx.call_on_close(executor.report)
     clients = Clients(OC_LOGIN_TOKEN, OC_LOGIN_SERVER)
     clients.docker.login(username=QUAY_USER, password=QUAY_TOKEN, registry="quay.io")
     clients.docker.login(
@@ -86,30 +106,67 @@ def build(clients):
 
 
 @main.command()
+@click.option(
+    "--budget",
+    default=IMAGE_CACHE_BUDGET,
+    show_default=True,
+    help="Disk budget for local images, e.g. 20G",
+)
+@click.option("--pin", multiple=True, help="Image which is never evicted, can be repeated")
 @click.pass_obj
-def smoke_tests(clients):
-    ns = os.getenv("NAMESPACE", "")
+def cache(clients, budget, pin):
+    """Prune local images over the disk budget, least recently used first."""
+    pinned = [*pin, MC_IMAGE, *dockerfile_base_images(APP_ROOT, DOCKERFILE)]
+    if IMAGE:
+        pinned.append(IMAGE)
+    clients.docker.gc(parse_size(budget), pinned=pinned)
+
+
+@main.command()
+@click.pass_context
+def smoke_tests(ctx):
+    clients = ctx.obj
+    runner = SmokeTestRunner(
+        oc=clients.oc,
+        docker=clients.docker,
+        cji_name=COMPONENT_NAME,
+        cji_timeout=IQE_CJI_TIMEOUT,
+        namespace=os.getenv("NAMESPACE", ""),
+        job_name=JOB_NAME,
+        build_number=BUILD_NUMBER,
+        iqe_image_tag=IQE_IMAGE_TAG,
+        iqe_marker=IQE_MARKER_EXPRESSION,
+        iqe_filter=IQE_FILTER_EXPRESSION,
+        iqe_requirements=IQE_REQUIREMENTS,
+        iqe_requirements_priority=IQE_REQUIREMENTS_PRIORITY,
+        iqe_test_importance=IQE_TEST_IMPORTANCE,
+        iqe_plugins=IQE_PLUGINS,
+        artifacts_dir=ARTIFACTS_DIR,
+        shards=IQE_SHARDS,
+        shard_by=IQE_SHARD_BY,
+        shard_markers=[x for x in IQE_SHARD_MARKERS.split(";") if x],
+        shard_tests=Path(IQE_SHARD_TESTS).read_text().split() if IQE_SHARD_TESTS else [],
+        duration_index=IQE_DURATION_INDEX or None,
+    )
     try:
-        runner = SmokeTestRunner(
-            oc=clients.oc,
-            docker=clients.docker,
-            cji_name=COMPONENT_NAME,
-            cji_timeout=IQE_CJI_TIMEOUT,
-            namespace=ns,
-            job_name=JOB_NAME,
-            build_number=BUILD_NUMBER,
-            iqe_image_tag=IQE_IMAGE_TAG,
-            iqe_marker=IQE_MARKER_EXPRESSION,
-            iqe_filter=IQE_FILTER_EXPRESSION,
-            iqe_requirements=IQE_REQUIREMENTS,
-            iqe_requirements_priority=IQE_REQUIREMENTS_PRIORITY,
-            iqe_test_importance=IQE_TEST_IMPORTANCE,
-            iqe_plugins=IQE_PLUGINS,
-            artifacts_dir=ARTIFACTS_DIR,
-        )
-        runner.deploy_iqe_cji()
+        summary = runner.deploy_iqe_cji()
     finally:
         teardown(clients.oc, runner.namespace)
+    if summary:
+        ctx.exit(summary.exit_code)
+
+
+@main.command()
+@click.option(
+    "--namespace",
+    "-n",
+    default=lambda: os.getenv("NAMESPACE", ""),
+    help="Namespace to collect logs from, defaults to $NAMESPACE",
+)
+@click.pass_obj
+def snapshot_logs(clients, namespace):
+    """Collect container logs logged since the last snapshot or teardown."""
+    snapshot_pod_logs(clients.oc, namespace)
 
 
 @main.group()
@@ -0,0 +1,73 @@
+import json
+import logging
+import time
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+
+import attr
+
+from .clients.openshift import OpenshiftClient
+
+logger = logging.getLogger(__name__)
+
+
+@attr.s
+class ApplyResult:
+    kind: str = attr.ib()
+    name: str = attr.ib()
+    duration: float = attr.ib()
+    error: Optional[str] = attr.ib(default=None)
+
+    def __str__(self) -> str:
+        return f"{self.kind}/{self.name}"
+
+
+def _apply(oc: OpenshiftClient, namespace: str, items: List[Dict[str, Any]]) -> Optional[str]:
+    """Server-side apply `items` as a single List, return error message on failure."""
+    manifest = json.dumps({"kind": "List", "apiVersion": "v1", "items": items})
+    try:
+        oc.apply(
+            "--server-side",
+            "--force-conflicts",
+            filename="-",
+            namespace=namespace,
+            _in=manifest,
+            _silent=True,
+        )
+    except Exception as err:
+        return str(err)
+    return None
+
+
+def apply_objects(
+    oc: OpenshiftClient, namespace: str, items: List[Dict[str, Any]], batch_size: int = 50
+) -> List[ApplyResult]:
+    """Apply processed template objects in batches.
+
+    A failed batch is re-applied object by object to find out which objects failed.
+    """
+    results: List[ApplyResult] = []
+    for i in range(0, len(items), batch_size):
+        batch = items[i : i + batch_size]  # noqa
+        start = time.monotonic()
+        error = _apply(oc, namespace, batch)
+        duration = time.monotonic() - start
+        logger.info("Applied %d objects in %.2fs", len(batch), duration)
+        if not error:
+            results.extend(
+                ApplyResult(item["kind"], item["metadata"]["name"], duration / len(batch))
+                for item in batch
+            )
+            continue
+        for item in batch:
+            start = time.monotonic()
+            error = _apply(oc, namespace, [item])
+            result = ApplyResult(
+                item["kind"], item["metadata"]["name"], time.monotonic() - start, error
+            )
+            if error:
+                logger.error("Failed to apply %s: %s", result, error)
+            results.append(result)
+    return results
@@ -0,0 +1,162 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any
+from typing import cast
+from typing import Dict
+from typing import IO
+from typing import Optional
+
+import attr
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    # optional dependency, checked before use in `_open_compressed`
+    zstandard = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.json"
+OBJECTS_DIR = "objects"
+CHUNK_SIZE = 1024 * 1024
+
+
+def _open_compressed(path: Path, mode: str) -> IO[bytes]:
+    if path.suffix == ".zst":
+        if zstandard is None:
+            raise RuntimeError("'zstandard' package is required to handle .zst artifacts")
+        if "r" not in mode:
+            return zstandard.ZstdCompressor().stream_writer(open(path, mode))
+        return zstandard.ZstdDecompressor().stream_reader(open(path, mode), read_across_frames=True)
+    # artifacts are always opened in binary mode, so this is a GzipFile
+    return cast(IO[bytes], gzip.open(path, mode))
+
+
+@attr.s
+class ArtifactBundle:
+    """Content-addressed, compressed artifact store with an index manifest.
+
+    Every artifact is compressed into `objects/<sha256>` once, identical content
+    is stored only once. `index.json` maps artifact paths to their object, size,
+    hash and metadata, so single artifacts can be read without unpacking the rest.
+    Growing artifacts like container logs are appended to per-path stream objects.
+    """
+
+    root: Path = attr.ib(converter=Path)
+    compression: str = attr.ib(default="zstd")
+    index: Dict[str, Dict[str, Any]] = attr.ib(init=False, factory=dict)
+
+    def __attrs_post_init__(self) -> None:
+        if self.compression == "zstd" and zstandard is None:
+            logger.info("'zstandard' not installed, compressing artifacts with gzip")
+            self.compression = "gzip"
+        (self.root / OBJECTS_DIR).mkdir(parents=True, exist_ok=True)
+        index_path = self.root / INDEX_FILE
+        if index_path.exists():
+            self.index = json.loads(index_path.read_text())
+
+    @property
+    def extension(self) -> str:
+        return ".zst" if self.compression == "zstd" else ".gz"
+
+    def add(self, path: str, data: Optional[bytes], **metadata: Any) -> Optional[Dict[str, Any]]:
+        """Store `data` under `path`, skip compression when the same content is stored."""
+        if not data:
+            return None
+        digest = hashlib.sha256(data).hexdigest()
+        object_path = self._find_object(digest)
+        if object_path is None:
+            object_path = self.root / OBJECTS_DIR / f"{digest}{self.extension}"
+            with _open_compressed(object_path, "wb") as f:
+                for i in range(0, len(data), CHUNK_SIZE):
+                    f.write(data[i : i + CHUNK_SIZE])  # noqa
+        else:
+            logger.debug("%s is identical to already stored artifact, skipping", path)
+        entry = {
+            "path": path,
+            "object": str(object_path.relative_to(self.root)),
+            "size": len(data),
+            "compressed_size": object_path.stat().st_size,
+            "hash": digest,
+            **metadata,
+        }
+        previous = self.index.get(path)
+        self.index[path] = entry
+        if previous and previous["object"] != entry["object"]:
+            self._remove_unreferenced(previous["object"])
+        return entry
+
+    def _remove_unreferenced(self, object_name: str) -> None:
+        """Delete an object replaced in the index unless another artifact references it."""
+        if any(entry["object"] == object_name for entry in self.index.values()):
+            return
+        (self.root / object_name).unlink(missing_ok=True)
+
+    def append(self, path: str, data: Optional[bytes], **metadata: Any) -> Optional[Dict[str, Any]]:
+        """Append `data` to a growing artifact such as a container log.
+
+        Appended data is compressed as a new gzip member/zstd frame, so the object
+        remains readable as a whole. Only the appended data is hashed, the entry
+        keeps a hash per append instead of one of the whole content.
+        """
+        previous = self.index.get(path)
+        entry = previous if previous and previous.get("stream") else None
+        if entry is None:
+            digest = hashlib.sha256(path.encode()).hexdigest()
+            object_path = self.root / OBJECTS_DIR / f"stream-{digest}{self.extension}"
+            object_path.unlink(missing_ok=True)
+        else:
+            object_path = self.root / entry["object"]
+        if data:
+            with _open_compressed(object_path, "ab") as f:
+                for i in range(0, len(data), CHUNK_SIZE):
+                    f.write(data[i : i + CHUNK_SIZE])  # noqa
+        if not object_path.exists():
+            return None
+        hashes = list(entry.get("hashes", [])) if entry else []
+        if data:
+            hashes.append(hashlib.sha256(data).hexdigest())
+        entry = {
+            **(entry or {}),
+            "path": path,
+            "object": str(object_path.relative_to(self.root)),
+            "size": (entry["size"] if entry else 0) + len(data or b""),
+            "compressed_size": object_path.stat().st_size,
+            "hashes": hashes,
+            "stream": True,
+            **metadata,
+        }
+        self.index[path] = entry
+        if previous and previous["object"] != entry["object"]:
+            self._remove_unreferenced(previous["object"])
+        return entry
+
+    def _find_object(self, digest: str) -> Optional[Path]:
+        for ext in (".zst", ".gz"):
+            object_path = self.root / OBJECTS_DIR / f"{digest}{ext}"
+            if object_path.exists():
+                return object_path
+        return None
+
+    def read(self, path: str) -> bytes:
+        with _open_compressed(self.root / self.index[path]["object"], "rb") as f:
+            return f.read()
+
+    def write_index(self, log_stats: bool = True) -> None:
+        """Write `index.json`, atomically so an interrupted write keeps the previous index."""
+        index_path = self.root / INDEX_FILE
+        tmp_path = index_path.with_name(f"{INDEX_FILE}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.index, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, index_path)
+        if not log_stats:
+            return
+        size = sum(entry["size"] for entry in self.index.values())
+        stored = sum(p.stat().st_size for p in (self.root / OBJECTS_DIR).iterdir())
+        logger.info(
+            "Stored %d artifacts, %d bytes compressed to %d bytes", len(self.index), size, stored
+        )
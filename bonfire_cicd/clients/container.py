@@ -1,25 +1,131 @@
+import json
 import logging
+import os
+import tempfile
+import time
+from pathlib import Path
 from typing import Any
 from typing import Dict
 from typing import Iterator
 from typing import List
 from typing import Optional
+from typing import Sequence
 from typing import Tuple
 from typing import Union
 
 import attr
 from docker import DockerClient
+from docker.errors import APIError as DockerAPIError
 from docker.errors import BuildError as DockerBuildError
 from docker.models.images import Image as DockerImage
 from docker.utils import parse_repository_tag
-from invoke import run
 from invoke.exceptions import UnexpectedExit
 from podman import PodmanClient
 from podman.domain.images import Image as PodmanImage
+from podman.errors import APIError as PodmanAPIError
 from podman.errors import BuildError as PodmanBuildError
 
+from .executor import executor
+from .executor import skip_on_dry_run
+
 log = logging.getLogger(__name__)
 
+IMAGE_CACHE_STATE = os.getenv(
+    "IMAGE_CACHE_STATE", str(Path.home() / ".cache" / "bonfire-cicd" / "images.json")
+)
+# number of builds kept to compute cache hit rate over time
+BUILD_HISTORY = 100
+
+
+def _image_ref(image: str) -> str:
+    """Fully qualified reference, podman reports `python:3.9` as `docker.io/library/python:3.9`."""
+    repository, tag = parse_repository_tag(image)
+    separator = "@" if "@" in image else ":"
+    domain, __, remainder = repository.partition("/")
+    if domain in ("docker.io", "index.docker.io"):
+        repository = remainder
+    elif remainder and ("." in domain or ":" in domain or domain == "localhost"):
+        return f"{repository}{separator}{tag or 'latest'}"
+    if "/" not in repository:
+        repository = f"library/{repository}"
+    return f"docker.io/{repository}{separator}{tag or 'latest'}"
+
+
+def _image_id(image_id: str) -> str:
+    """Image id without the digest algorithm, podman reports ids without it."""
+    return image_id.split(":", 1)[-1]
+
+
+def dockerfile_base_images(path: str, dockerfile: str) -> List[str]:
+    images: List[str] = []
+    dockerfile_path = Path(path) / dockerfile
+    if not dockerfile_path.is_file():
+        return images
+    with open(dockerfile_path, "r") as f:
+        for line in f.readlines():
+            if line.lower().startswith("from"):
+                images.append(line.split()[1])
+    return images
+
+
+def _count_cached_steps(logs: Sequence[Any]) -> Tuple[int, int]:
+    """Count build steps and steps taken from cache in docker/podman build output."""
+    steps = cached = 0
+    for chunk in logs:
+        if isinstance(chunk, dict):
+            chunk = chunk.get("stream", "")
+        if isinstance(chunk, bytes):
+            chunk = chunk.decode(errors="ignore")
+        for line in str(chunk).splitlines():
+            if line.lstrip().upper().startswith("STEP "):
+                steps += 1
+            if "Using cache" in line:
+                cached += 1
+    return steps, cached
+
+
+@attr.s
+class ImageCacheState:
+    """Last use of local images and cache hits of builds, kept across runs on the agent."""
+
+    path: str = attr.ib()
+    last_used: Dict[str, float] = attr.ib(
+        factory=dict,
+        converter=lambda x: {_image_ref(ref): used for ref, used in x.items()},  # type: ignore
+    )
+    builds: List[Dict[str, Any]] = attr.ib(factory=list)
+
+    @classmethod
+    def load(cls, path: str) -> "ImageCacheState":
+        try:
+            return cls(path, **json.loads(Path(path).read_text()))
+        except (OSError, ValueError, TypeError):
+            return cls(path)
+
+    def save(self) -> None:
+        """Write the state atomically, concurrent jobs on the agent must not see it half-written."""
+        path = Path(self.path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"last_used": self.last_used, "builds": self.builds[-BUILD_HISTORY:]}, f)
+        os.replace(tmp_path, path)
+
+    def touch(self, *images: str) -> None:
+        now = time.time()
+        for image in images:
+            self.last_used[_image_ref(image)] = now
+        self.save()
+
+    def record_build(self, tag: str, steps: int, cached: int) -> None:
+        self.builds.append({"tag": tag, "time": time.time(), "steps": steps, "cached": cached})
+        self.touch(tag)
+
+    def hit_rate(self, last: Optional[int] = None) -> Optional[float]:
+        builds = self.builds[-last:] if last else self.builds
+        steps = sum(build["steps"] for build in builds)
+        return sum(build["cached"] for build in builds) / steps if steps else None
+
 
 @attr.s
 class ContainerClient:
@@ -37,13 +143,19 @@ class ContainerClient:
             self.client = DockerClient(base_url=self.base_url)
 
     @classmethod
-    def from_env(cls):
-        cls.client = PodmanClient.from_env() if cls.podman_available() else DockerClient.from_env()
+    def from_env(cls) -> "ContainerClient":
+        container_client = cls.__new__(cls)
+        container_client.base_url = None
+        container_client.auth = {}
+        container_client.client = (
+            PodmanClient.from_env() if cls.podman_available() else DockerClient.from_env()
+        )
+        return container_client
 
     @staticmethod
     def podman_available() -> bool:
         try:
-            return bool(run("which podman"))
+            return bool(executor.run("which podman"))
         except UnexpectedExit:
             return False
 
@@ -55,20 +167,20 @@ class ContainerClient:
                     return self.auth[registry]
         return None
 
+    @property
+    def cache_state(self) -> ImageCacheState:
+        if not hasattr(self, "_cache_state"):
+            self._cache_state = ImageCacheState.load(IMAGE_CACHE_STATE)
+        return self._cache_state
+
     def _podman_pull_from_dockerfile(self, path, dockerfile):
         if isinstance(self.client, PodmanClient):
-            dockerfile_path = f"{path}/{dockerfile}"
-            images = []
-            with open(dockerfile_path, "r") as f:
-                lines = f.readlines()
-                for line in lines:
-                    if line.lower().startswith("from"):
-                        images.append(line.split()[1])
-            for image in images:
+            for image in dockerfile_base_images(path, dockerfile):
                 repository, tag = parse_repository_tag(image)
                 auth_config = self._podman_auth(repository)
                 self.pull(repository, tag, auth_config=auth_config)
 
+    @skip_on_dry_run(default={})
     def login(
         self,
         username: str,
@@ -83,9 +195,11 @@ class ContainerClient:
             return self.auth
         return self.client.login(username=username, password=password, registry=registry, **kwargs)
 
+    @skip_on_dry_run()
     def pull(
         self, repository: str, tag: Optional[str] = None, all_tags: bool = False, **kwargs
     ) -> Union[Union[PodmanImage, DockerImage], List[Union[PodmanImage, DockerImage]]]:
+        self.cache_state.touch(f"{repository}:{tag}" if tag else repository)
         auth_config = kwargs.get("auth_config") or self._podman_auth(repository)
         if auth_config:
             return self.client.images.pull(
@@ -94,31 +208,121 @@ class ContainerClient:
         # podman client can't handle auth_config=None in kwargs
         return self.client.images.pull(repository, tag, all_tags, **kwargs)
 
+    @skip_on_dry_run()
     def build(
         self, path: str, tag: str, dockerfile: str, **kwargs
     ) -> Tuple[Union[PodmanImage, DockerImage], Iterator[bytes]]:
         self._podman_pull_from_dockerfile(path, dockerfile)
+        self.cache_state.touch(*dockerfile_base_images(path, dockerfile))
         if kwargs.get("cache_from"):
             log.info("Attempting to build image using cache")
             repository, __ = parse_repository_tag(tag)
             auth_config = kwargs.get("auth_config") or self._podman_auth(repository)
             self.pull(repository=repository, auth_config=auth_config, cache_from=True)
             try:
-                return self.client.images.build(
-                    path=path,
-                    tag=tag,
-                    dockerfile=dockerfile,
-                    cache_from=[kwargs["cache_from"]],
+                return self._record_build(
+                    tag,
+                    self.client.images.build(
+                        path=path,
+                        tag=tag,
+                        dockerfile=dockerfile,
+                        cache_from=[kwargs["cache_from"]],
+                    ),
                 )
             except (PodmanBuildError, DockerBuildError):
                 log.info("Build from cache failed, attempting build without cache")
                 pass
-        return self.client.images.build(
-            path=path,
-            tag=tag,
-            dockerfile=dockerfile,
+        return self._record_build(
+            tag,
+            self.client.images.build(
+                path=path,
+                tag=tag,
+                dockerfile=dockerfile,
+            ),
         )
 
+    def _record_build(
+        self, tag: str, result: Tuple[Union[PodmanImage, DockerImage], Iterator[Any]]
+    ) -> Tuple[Union[PodmanImage, DockerImage], Iterator[Any]]:
+        image, logs = result
+        log_lines = list(logs)
+        steps, cached = _count_cached_steps(log_lines)
+        log.info("Build of %s used cache for %d of %d steps", tag, cached, steps)
+        self.cache_state.record_build(tag, steps, cached)
+        return image, iter(log_lines)
+
+    def _disk_usage(self) -> Tuple[int, Dict[str, int]]:
+        """Disk used by image layers and bytes only used by each image, by image id.
+
+        Uses the engine's own accounting, so layers shared by images count once.
+        """
+        df = self.client.df()
+        images = df.get("Images") or []
+        if "LayersSize" in df:
+            # docker, `SharedSize` is -1 when it was not computed
+            unique = {
+                _image_id(image["Id"]): image["Size"] - max(image.get("SharedSize", 0), 0)
+                for image in images
+            }
+            return df["LayersSize"], unique
+        unique = {_image_id(image["ImageID"]): image["UniqueSize"] for image in images}
+        return df.get("ImagesSize", sum(unique.values())), unique
+
+    @skip_on_dry_run(default=0)
+    def gc(self, budget: int, pinned: Sequence[str] = ()) -> int:
+        """Prune dangling images and evict least recently used ones above `budget` bytes.
+
+        Images tagged with one of `pinned` references are never evicted. Disk usage
+        is taken from the engine (`docker system df`/`podman system df`) and measured
+        again after evictions, as removing an image can make shared layers unique to
+        another one. Returns number of bytes freed.
+        """
+        self.client.images.prune(filters={"dangling": True})
+        pinned_refs = {_image_ref(image) for image in pinned}
+        last_used = self.cache_state.last_used
+        images = [
+            image
+            for image in self.client.images.list()
+            if not pinned_refs.intersection(_image_ref(tag) for tag in image.tags)
+        ]
+        images.sort(
+            key=lambda image: max(
+                (last_used.get(_image_ref(tag), 0.0) for tag in image.tags), default=0.0
+            )
+        )
+        candidates = iter(images)
+        initial, unique = self._disk_usage()
+        total = initial
+        while total > budget:
+            # evict by estimated unique size until within budget, then measure again
+            estimate = total
+            removed = 0
+            for image in candidates:
+                try:
+                    self.client.images.remove(image.id)
+                except (PodmanAPIError, DockerAPIError) as err:
+                    log.info("Failed to remove image %s: %s", image.tags or image.id, err)
+                    continue
+                log.info("Removed image %s", image.tags or image.id)
+                removed += 1
+                estimate -= unique.get(_image_id(image.id), 0)
+                for tag in image.tags:
+                    last_used.pop(_image_ref(tag), None)
+                if estimate <= budget:
+                    break
+            if not removed:
+                break
+            total, unique = self._disk_usage()
+        self.cache_state.save()
+
+        log.info("Freed %d bytes, %d bytes of image layers left", initial - total, total)
+        for last in (10, None):
+            hit_rate = self.cache_state.hit_rate(last)
+            if hit_rate is not None:
+                log.info("Build cache hit rate of %s builds: %.0f%%", last or "all", hit_rate * 100)
+        return initial - total
+
+    @skip_on_dry_run()
     def push(
         self, repository: str, tag: Optional[str] = None, **kwargs
     ) -> Union[str, Iterator[Union[str, Dict[str, Any]]]]:
@@ -0,0 +1,212 @@
+import atexit
+import functools
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import attr
+import click
+from bonfire.openshift import oc as _oc
+from distutils.util import strtobool
+from invoke import run as _run
+from invoke.runners import Promise
+
+log = logging.getLogger(__name__)
+
+# commands which don't change anything and are safe to de-duplicate
+READ_ONLY_COMMANDS = (
+    "which",
+    "oc get",
+    "oc whoami",
+    "oc version",
+    "oc api-resources",
+    "oc api-versions",
+)
+# estimated duration of commands with no recorded history
+DEFAULT_COST = 1.0
+
+COMMAND_STATS = os.getenv("CICD_COMMAND_STATS", "")
+DEDUP_COMMANDS = bool(strtobool(os.getenv("CICD_DEDUP_COMMANDS", "false")))
+
+
+def _kind(args: Tuple[str, ...]) -> str:
+    """Group commands by executable and subcommand, e.g. `oc get` or `bonfire deploy`."""
+    return " ".join(arg for arg in args[:2] if not arg.startswith("-"))
+
+
+@attr.s
+class DryRunResult:
+    """Stand-in for results of commands which are only planned."""
+
+    stdout: Any = attr.ib(default="")
+    pid: int = attr.ib(default=0)
+    process_is_finished: bool = attr.ib(default=True)
+
+    @property
+    def runner(self) -> "DryRunResult":
+        return self
+
+    def join(self) -> "DryRunResult":
+        return self
+
+    def kill(self) -> None:
+        pass
+
+
+@attr.s
+class CommandStats:
+    count: int = attr.ib(default=0)
+    cached: int = attr.ib(default=0)
+    duration: float = attr.ib(default=0.0)
+
+
+@attr.s
+class TimedPromise:
+    """Asynchronous command started by `invoke.run`, timed until it is joined."""
+
+    promise: Promise = attr.ib()
+    stats: CommandStats = attr.ib()
+    start: float = attr.ib(factory=time.monotonic)
+    joined: bool = attr.ib(init=False, default=False)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.promise, name)
+
+    def join(self) -> Any:
+        try:
+            return self.promise.join()
+        finally:
+            if not self.joined:
+                self.joined = True
+                self.stats.duration += time.monotonic() - self.start
+
+
+@attr.s
+class CommandExecutor:
+    """Run every subprocess of the pipeline, count and time it.
+
+    Identical read-only commands can be de-duplicated within a run. In dry-run
+    mode commands are only recorded and printed as a plan with estimated cost
+    based on durations recorded by previous runs in `stats_file`.
+    """
+
+    dry_run: bool = attr.ib(default=False)
+    dedup: bool = attr.ib(default=False)
+    stats_file: str = attr.ib(default="")
+    stats: Dict[str, CommandStats] = attr.ib(init=False, factory=dict)
+    planned: List[Tuple[str, ...]] = attr.ib(init=False, factory=list)
+    _cache: Dict[str, Any] = attr.ib(init=False, factory=dict)
+
+    def _execute(
+        self, args: Tuple[str, ...], func: Callable[[], Any], cache: bool, dry_run_result: Any
+    ) -> Any:
+        kind = _kind(args)
+        stats = self.stats.setdefault(kind, CommandStats())
+        stats.count += 1
+        if self.dry_run:
+            self.planned.append(args)
+            return dry_run_result
+        key = json.dumps(args)
+        if cache and self.dedup and kind.startswith(READ_ONLY_COMMANDS) and key in self._cache:
+            stats.cached += 1
+            return self._cache[key]
+        start = time.monotonic()
+        try:
+            result = func()
+        except Exception:
+            stats.duration += time.monotonic() - start
+            raise
+        if isinstance(result, Promise):
+            # the command is still running, time it until it is joined
+            return TimedPromise(result, stats, start)
+        stats.duration += time.monotonic() - start
+        if cache and self.dedup and kind.startswith(READ_ONLY_COMMANDS):
+            self._cache[key] = result
+        return result
+
+    def run(self, command: str, _cache: bool = True, **kwargs: Any) -> Any:
+        """Run a shell command with `invoke.run`."""
+        args = tuple(command.split())
+        return self._execute(
+            args, lambda: _run(command, **kwargs), _cache, DryRunResult(stdout="dry-run")
+        )
+
+    def oc(self, *args: Any, _cache: bool = True, **kwargs: Any) -> Any:
+        """Run `oc` through bonfire, arguments as in `bonfire.openshift.oc`."""
+        str_args = ("oc", *(str(arg) for arg in args))
+        output = '{"items": []}' if "json" in str_args else ""
+        return self._execute(
+            str_args, lambda: _oc(*args, **kwargs), _cache, DryRunResult(stdout=output.encode())
+        )
+
+    def _history(self) -> Dict[str, Dict[str, float]]:
+        if self.stats_file and Path(self.stats_file).exists():
+            return json.loads(Path(self.stats_file).read_text())
+        return {}
+
+    def save(self) -> None:
+        """Merge durations of this run into `stats_file`."""
+        if self.dry_run or not self.stats_file:
+            return
+        history = self._history()
+        for kind, stats in self.stats.items():
+            executed = stats.count - stats.cached
+            if not executed:
+                continue
+            total = history.setdefault(kind, {"count": 0, "duration": 0.0})
+            total["count"] += executed
+            total["duration"] += stats.duration
+        Path(self.stats_file).write_text(json.dumps(history, indent=2, sort_keys=True))
+
+    def report(self) -> None:
+        if self.dry_run:
+            self._report_plan()
+            return
+        log.info("%-24s %6s %6s %10s", "command", "count", "cached", "duration")
+        for kind, stats in sorted(self.stats.items(), key=lambda x: -x[1].duration):
+            log.info("%-24s %6d %6d %9.2fs", kind, stats.count, stats.cached, stats.duration)
+        log.info("%d subprocesses", sum(s.count - s.cached for s in self.stats.values()))
+
+    def _report_plan(self) -> None:
+        history = self._history()
+        total = 0.0
+        click.echo("Planned commands:")
+        for i, args in enumerate(self.planned, 1):
+            kind = _kind(args)
+            if kind in history and history[kind]["count"]:
+                cost = history[kind]["duration"] / history[kind]["count"]
+            else:
+                cost = DEFAULT_COST
+            total += cost
+            click.echo(f"{i:4}. [~{cost:7.2f}s] {' '.join(args)}")
+        click.echo(f"{len(self.planned)} commands, estimated {total:.2f}s")
+        if not history:
+            click.echo(f"no recorded history, estimated {DEFAULT_COST}s per command")
+
+
+def skip_on_dry_run(default: Optional[Any] = None) -> Callable:
+    """Skip calls which don't run subprocesses but talk to the cluster or registries."""
+
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if executor.dry_run:
+                log.info("[dry-run] skipping %s", func.__qualname__)
+                return default
+            return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+executor = CommandExecutor(dedup=DEDUP_COMMANDS, stats_file=COMMAND_STATS)
+atexit.register(executor.save)
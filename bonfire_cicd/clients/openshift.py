@@ -4,8 +4,8 @@ from typing import Optional
 from typing import Union
 
 import attr
-from bonfire.openshift import oc
 
+from .executor import executor
 from .utils import OC_ACTIONS
 
 
@@ -16,7 +16,7 @@ class OcAction:
 
     def __call__(self, *args: str, **kwargs: Dict[str, Any]) -> Union[str, None]:
         params = []
-        sh_kwargs = {}
+        sh_kwargs: Dict[str, Any] = {}
         for key, val in kwargs.items():
             if key.startswith("_"):
                 sh_kwargs[key] = val
@@ -27,7 +27,7 @@ class OcAction:
         args = [self.name.replace("_", "-"), *args]  # type: ignore
         if self.parent:
             args = [self.parent.name.replace("_", "-"), *args]  # type: ignore
-        return oc(*args, *params, **sh_kwargs)
+        return executor.oc(*args, *params, **sh_kwargs)
 
 
 @attr.s
@@ -43,7 +43,7 @@ class OpenshiftClient:
             self.project(self.namespace)
 
     def __call__(self, *args: Any, **kwargs: Any) -> Union[str, None]:
-        return oc(*args, **kwargs)
+        return executor.oc(*args, **kwargs)
 
     def load(self) -> None:
         """Load client actions."""
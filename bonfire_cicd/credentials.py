@@ -0,0 +1,89 @@
+import base64
+import json
+import logging
+from typing import Any
+from typing import Dict
+from typing import Optional
+
+import attr
+from bonfire.utils import FatalError
+
+from .clients.openshift import OpenshiftClient
+
+logger = logging.getLogger(__name__)
+
+# namespace -> secret name -> key -> decoded value
+_SECRETS_CACHE: Dict[str, Dict[str, Dict[str, bytes]]] = {}
+
+
+def clear_cache(namespace: Optional[str] = None) -> None:
+    """Drop cached secrets for `namespace`, or for all namespaces."""
+    if namespace:
+        _SECRETS_CACHE.pop(namespace, None)
+    else:
+        _SECRETS_CACHE.clear()
+
+
+@attr.s
+class CredentialsResolver:
+    """Resolve secrets of a namespace with a single `oc get secret` call.
+
+    All secrets are listed and decoded once, the result is cached in-process
+    for the rest of the run and shared by every resolver of the namespace.
+    """
+
+    oc: OpenshiftClient = attr.ib()
+    namespace: str = attr.ib()
+
+    def _load(self) -> Dict[str, Dict[str, bytes]]:
+        if self.namespace in _SECRETS_CACHE:
+            return _SECRETS_CACHE[self.namespace]
+        logger.info("Fetching secrets from ns: %s", self.namespace)
+        secrets_json = json.loads(
+            self.oc.get.secret(
+                namespace=self.namespace, output="json", _silent=True, _cache=False
+            ).stdout
+        )
+        secrets = {}
+        for item in secrets_json.get("items", []):
+            data = item.get("data") or {}
+            secrets[item["metadata"]["name"]] = {
+                key: base64.b64decode(val) for key, val in data.items()
+            }
+        _SECRETS_CACHE[self.namespace] = secrets
+        return secrets
+
+    def refresh(self) -> None:
+        clear_cache(self.namespace)
+        self._load()
+
+    def secret(self, name: str) -> Dict[str, bytes]:
+        secrets = self._load()
+        if name not in secrets:
+            # secret could be created after the first fetch, e.g. by clowder
+            self.refresh()
+            secrets = _SECRETS_CACHE[self.namespace]
+        try:
+            return secrets[name]
+        except KeyError:
+            raise FatalError(f"secret '{name}' not found in ns '{self.namespace}'")
+
+    def get(self, name: str, key: str) -> str:
+        try:
+            return self.secret(name)[key].decode("utf-8")
+        except KeyError:
+            raise FatalError(f"key '{key}' not found in secret '{name}'")
+
+    def get_json(self, name: str, key: str) -> Dict[str, Any]:
+        return json.loads(self.get(name, key))
+
+    def db_creds(self, app_name: str) -> Dict[str, Any]:
+        """Database credentials from clowder's `cdappconfig.json`."""
+        return self.get_json(app_name, "cdappconfig.json").get("database", {})
+
+    def minio_creds(self) -> Dict[str, str]:
+        secret_name = f"env-{self.namespace}-minio"
+        return {
+            "access_key": self.get(secret_name, "accessKey"),
+            "secret_key": self.get(secret_name, "secretKey"),
+        }
@@ -1,15 +1,25 @@
-import base64
-import json
+import inspect
 import logging
 import os
+import time
+from typing import Any
+from typing import Dict
+from typing import List
 
 import attr
+from bonfire.bonfire import _process
 from bonfire.bonfire import FatalError
-from invoke import run
 
+from .apply import apply_objects
+from .clients.executor import executor
+from .clients.executor import skip_on_dry_run
 from .clients.openshift import OpenshiftClient
+from .credentials import CredentialsResolver
+from .readiness import clowdapp_databases
+from .readiness import ReadinessWatcher
 from .utils import convert_arg
 from .utils import set_port_forward
+from .utils import split_arg
 from .utils import teardown
 
 logger = logging.getLogger(__name__)
@@ -41,7 +51,8 @@ class EphemeralDeployerBase:
 
     def _reserve_namespace(self):
         if not self.namespace:
-            self.namespace = run("bonfire namespace reserve", echo=True).stdout.rstrip("\n")
+            reservation = executor.run("bonfire namespace reserve", echo=True)
+            self.namespace = reservation.stdout.rstrip("\n")
 
     def _pre_deploy(self):
         raise NotImplementedError
@@ -74,7 +85,7 @@ class EphemeralDeployer(EphemeralDeployerBase):
         pass
 
     def _deploy(self):
-        run(
+        deployment = executor.run(
             f"""
             bonfire deploy {self.app_name} \
                 --source=appsre \
@@ -88,7 +99,17 @@ class EphemeralDeployer(EphemeralDeployerBase):
                 {self.extra_deploy_args}
             """,
             echo=True,
+            asynchronous=True,
         )
+        # report progress and stop early on broken pods while bonfire waits on resources
+        watcher = ReadinessWatcher(self.oc, self.namespace, timeout=self.deploy_timeout)
+        try:
+            watcher.wait(until=lambda: deployment.runner.process_is_finished)
+        finally:
+            # don't leave bonfire running while the namespace is torn down
+            if not deployment.runner.process_is_finished:
+                deployment.runner.kill()
+        deployment.join()
 
 
 @attr.s
@@ -99,32 +120,64 @@ class EphemeralDeployerDB(EphemeralDeployerBase):
         os.environ["DB_NAMESPACE"] = self.namespace
         # self.db_deployment_name = os.getenv("DB_DEPLOYMENT_NAME", f"{self.component_name}-db")
 
-    def _deploy(self):
-        run(
-            f"""
-            bonfire process {self.app_name} \
-                --source=appsre \
-                --ref-env {self.ref_env} \
-                --set-template-ref {self.template_ref} \
-                --set-image-tag {self.image}={self.image_tag} \
-                --namespace {self.namespace} \
-                --no-get-dependencies \
-                {self.components} \
-                {self.components_resources} | oc apply -f - -n {self.namespace}
-            """,
-            echo=True,
+    @skip_on_dry_run(default=[])
+    def _process_template(self) -> List[Dict[str, Any]]:
+        component, ref = self.template_ref.split("=", 1)
+        # `_process` is private API of crc-bonfire 4.x, its signature changes between majors
+        process_kwargs = dict(
+            app_names=(self.app_name,),
+            source="appsre",
+            get_dependencies=False,
+            optional_deps_method="hybrid",
+            set_image_tag={self.image: self.image_tag},
+            ref_env=self.ref_env,
+            target_env="insights-ephemeral",
+            set_template_ref={component: ref},
+            set_parameter={},
+            clowd_env=f"env-{self.namespace}",
+            local_config_path=None,
+            remove_resources=(),
+            no_remove_resources=split_arg(self.components_resources),
+            remove_dependencies=(),
+            no_remove_dependencies=(),
+            single_replicas=True,
+            component_filter=split_arg(self.components),
+            local=True,
+            frontends=False,
         )
-        run(f"bonfire namespace wait-on-resources {self.namespace} --db-only", echo=True)
+        try:
+            inspect.signature(_process).bind(**process_kwargs)
+        except TypeError as err:
+            raise FatalError(f"unsupported crc-bonfire version, 'bonfire._process': {err}")
+        processed = _process(**process_kwargs)
+        return processed.get("items", [])
 
+    def _deploy(self):
+        start = time.monotonic()
+        items = self._process_template()
+        logger.info("Processed %d objects in %.2fs", len(items), time.monotonic() - start)
+        results = apply_objects(self.oc, self.namespace, items)
+        failed = [str(result) for result in results if result.error]
+        if failed:
+            raise FatalError(f"failed to apply objects: {', '.join(failed)}")
+        for result in sorted(results, key=lambda x: x.duration, reverse=True)[:5]:
+            logger.info("Applied %s in %.2fs", result, result.duration)
+        # clowder creates DB deployments one by one, wait for those of all ClowdApps
+        ReadinessWatcher(
+            self.oc,
+            self.namespace,
+            timeout=self.deploy_timeout,
+            name_filter=lambda name: name.endswith("-db"),
+            expected=clowdapp_databases(self.oc, self.namespace),
+        ).wait()
+
+    @skip_on_dry_run()
     def _post_deploy(self):
         # Set up port-forward for DB
         local_db_port = set_port_forward(self.oc, self.db_deployment_name, "5432", self.namespace)
 
         # Store database access info to env vars
-        secret = self.oc.get.secret(self.component_name, output="json", namespace=self.namespace)
-        secret_json = json.loads(secret.stdout)
-        decoded = base64.b64decode(secret_json["data"]["cdappconfig.json"])
-        db_creds = json.loads(decoded).get("database", {})
+        db_creds = CredentialsResolver(self.oc, self.namespace).db_creds(self.component_name)
         db_name = db_creds.get("name")
         if not db_name:
             teardown(self.oc, self.namespace)
@@ -0,0 +1,148 @@
+import heapq
+import logging
+import sqlite3
+import time
+from pathlib import Path
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+import attr
+
+logger = logging.getLogger(__name__)
+
+# duration of tests with no recorded history
+DEFAULT_DURATION = 10.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS durations (
+    test_id TEXT PRIMARY KEY,
+    runs INTEGER NOT NULL,
+    total REAL NOT NULL,
+    last REAL NOT NULL,
+    failures INTEGER NOT NULL,
+    updated REAL NOT NULL
+)
+"""
+
+
+def test_keywords(test_id: str) -> List[str]:
+    """Names of the module, class and test of `test_id` as matched by `-k`.
+
+    Test ids are pytest node ids, `path/test_module.py::TestClass::test_name[param]`,
+    or ids of junit results, `package.test_module.TestClass::test_name[param]`.
+    Parameters are dropped, all parameters of a test share its keywords.
+    """
+    *parents, name = test_id.split("[")[0].split("::")
+    if len(parents) == 1 and not parents[0].endswith(".py"):
+        # junit classname, the module followed by (nested) classes if any
+        components = parents[0].split(".")
+        i = len(components) - 1
+        while i > 0 and components[i][:1].isupper():
+            i -= 1
+        parents = components[i:]
+    elif parents:
+        parents[0] = Path(parents[0]).stem
+    return [*parents, name]
+
+
+def normalize_id(test_id: str) -> str:
+    """Id of a test in either format as `test_module::TestClass::test_name[param]`."""
+    __, bracket, params = test_id.partition("[")
+    return "::".join(test_keywords(test_id)) + bracket + params
+
+
+def filter_name(test_id: str) -> str:
+    """`--filter` term selecting `test_id`, e.g. `test_module and TestClass and test_name`."""
+    return " and ".join(test_keywords(test_id))
+
+
+@attr.s
+class DurationIndex:
+    """On-disk history of test durations across smoke test runs, keyed by normalized test id."""
+
+    path: str = attr.ib()
+    _pending: List[Tuple[str, float, int]] = attr.ib(init=False, factory=list)
+
+    def __attrs_post_init__(self) -> None:
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path)
+
+    def add(self, test_id: str, duration: float, outcome: str, message: str = "") -> None:
+        """Record a test result, a `results.ResultSink` to be fed by `summarize`."""
+        if outcome != "skipped":
+            failed = int(outcome in ("failure", "error"))
+            self._pending.append((normalize_id(test_id), duration, failed))
+
+    def flush(self) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                """
+                INSERT INTO durations VALUES (?, 1, ?, ?, ?, ?)
+                ON CONFLICT(test_id) DO UPDATE SET
+                    runs = runs + 1,
+                    total = total + excluded.total,
+                    last = excluded.last,
+                    failures = failures + excluded.failures,
+                    updated = excluded.updated
+                """,
+                [(test_id, dur, dur, failed, now) for test_id, dur, failed in self._pending],
+            )
+        logger.info("Recorded durations of %d tests in %s", len(self._pending), self.path)
+        self._pending.clear()
+
+    def durations(self) -> Dict[str, float]:
+        """Average duration of every known test by normalized test id."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT test_id, total, runs FROM durations").fetchall()
+        # ids recorded without normalization are merged with the normalized ones
+        totals: Dict[str, Tuple[float, int]] = {}
+        for test_id, total, runs in rows:
+            prev_total, prev_runs = totals.get(normalize_id(test_id), (0.0, 0))
+            totals[normalize_id(test_id)] = (prev_total + total, prev_runs + runs)
+        return {test_id: total / runs for test_id, (total, runs) in totals.items()}
+
+    def longest_first(self, test_ids: Sequence[str]) -> List[Tuple[str, float]]:
+        """Tests with their expected duration, longest first."""
+        durations = self.durations()
+        return sorted(
+            (
+                (test_id, durations.get(normalize_id(test_id), DEFAULT_DURATION))
+                for test_id in test_ids
+            ),
+            key=lambda x: x[1],
+            reverse=True,
+        )
+
+    def balanced_shards(
+        self,
+        shards: int,
+        test_ids: Sequence[str],
+        key: Optional[Callable[[str], str]] = None,
+    ) -> List[List[str]]:
+        """Split tests into shards of similar total duration, longest tests first.
+
+        With `key`, shards contain keys instead of test ids and tests with the
+        same key, e.g. all parameters of a test, are assigned together.
+        """
+        totals: Dict[str, float] = {}
+        for test_id, duration in self.longest_first(test_ids):
+            group_key = key(test_id) if key else test_id
+            totals[group_key] = totals.get(group_key, 0.0) + duration
+        loads = [(0.0, i) for i in range(shards)]
+        groups: List[List[str]] = [[] for _ in range(shards)]
+        for group_key, duration in sorted(totals.items(), key=lambda x: x[1], reverse=True):
+            load, i = heapq.heappop(loads)
+            groups[i].append(group_key)
+            heapq.heappush(loads, (load + duration, i))
+        for load, i in sorted(loads, key=lambda x: x[1]):
+            logger.info("shard %d: %d tests, expected %.0fs", i, len(groups[i]), load)
+        return [group for group in groups if group]
@@ -0,0 +1,149 @@
+import json
+import logging
+import time
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+
+import attr
+from bonfire.utils import FatalError
+
+from .clients.executor import skip_on_dry_run
+from .clients.openshift import OpenshiftClient
+
+logger = logging.getLogger(__name__)
+
+# container waiting reasons which will not recover without a new deploy, transient ones
+# like ErrImagePull or CreateContainerConfigError (secret not created yet) are retried
+FAIL_FAST_REASONS = (
+    "CrashLoopBackOff",
+    "ImagePullBackOff",
+    "InvalidImageName",
+)
+
+
+def _deployment_status(item: Dict[str, Any]) -> str:
+    desired = item["spec"].get("replicas", 1)
+    status = item.get("status", {})
+    ready = status.get("readyReplicas", 0)
+    if ready >= desired and status.get("observedGeneration", 0) >= item["metadata"].get(
+        "generation", 0
+    ):
+        return "Ready"
+    return f"{ready}/{desired} replicas ready"
+
+
+def _pod_failures(item: Dict[str, Any]) -> List[str]:
+    status = item.get("status", {})
+    failures = []
+    for container in status.get("initContainerStatuses", []) + status.get("containerStatuses", []):
+        waiting = container.get("state", {}).get("waiting") or {}
+        if waiting.get("reason") in FAIL_FAST_REASONS:
+            failures.append(
+                f"{container['name']}: {waiting['reason']} {waiting.get('message', '')}".rstrip()
+            )
+    return failures
+
+
+def clowdapp_databases(oc: OpenshiftClient, namespace: str) -> List[str]:
+    """Names of the DB deployments clowder creates for the ClowdApps in `namespace`."""
+    res = oc.get.clowdapp(namespace=namespace, output="json", _silent=True, _cache=False)
+    names = set()
+    for item in json.loads(res.stdout).get("items", []):
+        database = item["spec"].get("database") or {}
+        if database.get("name"):
+            names.add(f"{item['metadata']['name']}-db")
+        if database.get("sharedDbAppName"):
+            names.add(f"{database['sharedDbAppName']}-db")
+    return sorted(names)
+
+
+@attr.s
+class ReadinessWatcher:
+    """Poll deployments and pods of a namespace and report their progress.
+
+    Logs every status change together with time-to-ready per deployment and
+    fails fast when a pod ends up in one of `FAIL_FAST_REASONS`.
+    """
+
+    oc: OpenshiftClient = attr.ib()
+    namespace: str = attr.ib()
+    timeout: int = attr.ib(default=600, converter=lambda x: int(x or 600))  # type: ignore
+    interval: int = attr.ib(default=5, converter=int)
+    name_filter: Optional[Callable[[str], bool]] = attr.ib(default=None)
+    # deployments which have to exist and be ready, even if they're not created yet
+    expected: List[str] = attr.ib(factory=list)
+    started: float = attr.ib(init=False, factory=time.monotonic)
+    statuses: Dict[str, str] = attr.ib(init=False, factory=dict)
+    ready_times: Dict[str, float] = attr.ib(init=False, factory=dict)
+
+    def _watched(self, name: str) -> bool:
+        return self.name_filter is None or self.name_filter(name)
+
+    def _get_items(self) -> List[Dict[str, Any]]:
+        res = self.oc.get(
+            "deployments,pods", namespace=self.namespace, output="json", _silent=True, _cache=False
+        )
+        return json.loads(res.stdout).get("items", [])
+
+    def _update(self, resource: str, status: str) -> None:
+        if self.statuses.get(resource) == status:
+            return
+        self.statuses[resource] = status
+        elapsed = time.monotonic() - self.started
+        if status == "Ready":
+            self.ready_times[resource] = elapsed
+        logger.info("[%4ds] %s: %s", elapsed, resource, status)
+
+    def poll(self) -> bool:
+        """Refresh statuses, return True when all watched deployments are ready."""
+        items = self._get_items()
+        deployments: List[str] = []
+        failures: List[str] = []
+        for item in items:
+            name = item["metadata"]["name"]
+            if item["kind"] == "Deployment" and self._watched(name):
+                deployments.append(name)
+                self._update(f"deployment/{name}", _deployment_status(item))
+        for item in items:
+            name = item["metadata"]["name"]
+            if item["kind"] == "Pod" and any(name.startswith(d) for d in deployments):
+                self._update(f"pod/{name}", item.get("status", {}).get("phase", "Unknown"))
+                failures.extend(f"pod/{name} {failure}" for failure in _pod_failures(item))
+        if failures:
+            raise FatalError(f"deployment in ns '{self.namespace}' failed: {'; '.join(failures)}")
+        missing = [name for name in self.expected if name not in deployments]
+        for name in missing:
+            self._update(f"deployment/{name}", "not created yet")
+        return (
+            bool(deployments)
+            and not missing
+            and all(self.statuses[f"deployment/{name}"] == "Ready" for name in deployments)
+        )
+
+    @skip_on_dry_run()
+    def wait(self, until: Optional[Callable[[], bool]] = None) -> None:
+        """Wait until all watched deployments are ready.
+
+        With `until`, keep watching until it returns True instead. Deployments
+        which are ready before the watched process creates its own, e.g. those
+        of the ClowdEnvironment, must not end the watch early.
+        """
+        self.started = time.monotonic()
+        while True:
+            ready = self.poll()
+            done = until() if until else ready
+            if done:
+                break
+            if time.monotonic() - self.started > self.timeout:
+                raise FatalError(
+                    f"timed out after {self.timeout}s waiting on resources in ns '{self.namespace}'"
+                )
+            time.sleep(self.interval)
+        self.report()
+
+    def report(self) -> None:
+        for resource, elapsed in sorted(self.ready_times.items(), key=lambda x: x[1]):
+            logger.info("%s ready after %ds", resource, elapsed)
@@ -0,0 +1,160 @@
+import heapq
+import json
+import logging
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Protocol
+from typing import Sequence
+from typing import Tuple
+
+import attr
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_FILE = "results-summary.json"
+
+EXIT_PASSED = 0
+EXIT_FAILED = 1
+EXIT_NO_TESTS = 2
+
+
+class ResultSink(Protocol):
+    """Receives every testcase parsed by `parse_junit`."""
+
+    def add(self, test_id: str, duration: float, outcome: str, message: str = "") -> None:
+        ...
+
+
+@attr.s
+class Summary:
+    """Merged results of all junit files, slowest tests are kept in a bounded heap."""
+
+    slowest_count: int = attr.ib(default=20)
+    files: List[str] = attr.ib(factory=list)
+    tests: int = attr.ib(default=0)
+    failures: int = attr.ib(default=0)
+    errors: int = attr.ib(default=0)
+    skipped: int = attr.ib(default=0)
+    duration: float = attr.ib(default=0.0)
+    failed_tests: List[Dict[str, str]] = attr.ib(factory=list)
+    _slowest: List[Tuple[float, str]] = attr.ib(factory=list)
+
+    @property
+    def passed(self) -> int:
+        return self.tests - self.failures - self.errors - self.skipped
+
+    @property
+    def exit_code(self) -> int:
+        if not self.tests:
+            return EXIT_NO_TESTS
+        if self.failures or self.errors:
+            return EXIT_FAILED
+        return EXIT_PASSED
+
+    @property
+    def slowest(self) -> List[Dict[str, Any]]:
+        return [
+            {"test": test_id, "time": duration}
+            for duration, test_id in sorted(self._slowest, reverse=True)
+        ]
+
+    def add(self, test_id: str, duration: float, outcome: str, message: str = "") -> None:
+        self.tests += 1
+        self.duration += duration
+        if outcome == "failure":
+            self.failures += 1
+        elif outcome == "error":
+            self.errors += 1
+        elif outcome == "skipped":
+            self.skipped += 1
+        if outcome in ("failure", "error"):
+            self.failed_tests.append({"test": test_id, "outcome": outcome, "message": message})
+        if len(self._slowest) < self.slowest_count:
+            heapq.heappush(self._slowest, (duration, test_id))
+        else:
+            heapq.heappushpop(self._slowest, (duration, test_id))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "files": self.files,
+            "tests": self.tests,
+            "passed": self.passed,
+            "failures": self.failures,
+            "errors": self.errors,
+            "skipped": self.skipped,
+            "duration": round(self.duration, 3),
+            "exit_code": self.exit_code,
+            "failed_tests": self.failed_tests,
+            "slowest": self.slowest,
+        }
+
+
+def _test_id(testcase: ET.Element) -> str:
+    classname = testcase.get("classname")
+    name = testcase.get("name", "")
+    return f"{classname}::{name}" if classname else name
+
+
+def parse_junit(path: Path, *sinks: ResultSink) -> bool:
+    """Stream testcases of a junit file into `sinks`, return False if it's not junit."""
+    context = ET.iterparse(str(path), events=("start", "end"))
+    __, root = next(context)
+    if root.tag not in ("testsuites", "testsuite"):
+        return False
+    parents = [root]
+    for event, elem in context:
+        if event == "start":
+            parents.append(elem)
+            continue
+        parents.pop()
+        if elem.tag != "testcase":
+            continue
+        outcome, message = "passed", ""
+        for child in elem:
+            if child.tag in ("failure", "error", "skipped"):
+                outcome, message = child.tag, child.get("message", "")
+                break
+        for sink in sinks:
+            sink.add(_test_id(elem), float(elem.get("time") or 0), outcome, message)
+        # drop parsed testcases to keep memory constant
+        parents[-1].remove(elem)
+    return True
+
+
+def summarize(
+    artifacts_dir: str, slowest_count: int = 20, sinks: Sequence[ResultSink] = ()
+) -> Summary:
+    """Merge all junit files in `artifacts_dir` into a summary stored as JSON.
+
+    Testcases are also passed to `sinks` within the same pass over the files.
+    """
+    summary = Summary(slowest_count=slowest_count)
+    artifacts_path = Path(artifacts_dir)
+    for xml_file in sorted(artifacts_path.rglob("*.xml")):
+        try:
+            if parse_junit(xml_file, summary, *sinks):
+                summary.files.append(str(xml_file.relative_to(artifacts_path)))
+        except ET.ParseError as err:
+            logger.warning("Failed to parse %s: %s", xml_file, err)
+
+    with open(artifacts_path / SUMMARY_FILE, "w") as f:
+        json.dump(summary.to_dict(), f, indent=2)
+
+    logger.info(
+        "%d tests in %d junit files: %d passed, %d failed, %d errors, %d skipped in %.2fs",
+        summary.tests,
+        len(summary.files),
+        summary.passed,
+        summary.failures,
+        summary.errors,
+        summary.skipped,
+        summary.duration,
+    )
+    for test in summary.failed_tests:
+        logger.info("%s: %s", test["outcome"].upper(), test["test"])
+    for test in summary.slowest[:5]:
+        logger.info("slow: %s %.2fs", test["test"], test["time"])
+    return summary
@@ -1,18 +1,92 @@
+import hashlib
 import logging
+import shutil
 from pathlib import Path
 from time import sleep
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
 
 import attr
 from bonfire.utils import FatalError
-from invoke import run
 
 from .clients.container import ContainerClient
+from .clients.executor import executor
+from .clients.executor import skip_on_dry_run
 from .clients.openshift import OpenshiftClient
+from .durations import DurationIndex
+from .durations import filter_name
+from .results import summarize
+from .results import Summary
 from .utils import run_mc
 from .utils import setup_minio
 
 log = logging.getLogger(__name__)
 
+MC_IMAGE = "quay.io/cloudservices/mc"
+SHARD_BY = ("plugin", "marker", "hash", "duration")
+
+
+def _distribute(items: Sequence[str], shards: int) -> List[List[str]]:
+    """Split `items` round-robin into at most `shards` non-empty groups."""
+    groups: List[List[str]] = [[] for _ in range(min(shards, len(items)))]
+    for i, item in enumerate(items):
+        groups[i % len(groups)].append(item)
+    return groups
+
+
+def _hash_partition(test_ids: Sequence[str], shards: int) -> List[List[str]]:
+    """Split tests by hash of their filter term, keeps all parameters of a test together."""
+    groups: List[List[str]] = [[] for _ in range(shards)]
+    for term in dict.fromkeys(filter_name(test_id) for test_id in test_ids):
+        groups[int(hashlib.sha1(term.encode()).hexdigest(), 16) % shards].append(term)
+    return [group for group in groups if group]
+
+
+def _matches(term: str, keywords: Sequence[str]) -> bool:
+    """Whether a filter term selects a test, `-k` matches names by substring."""
+    return all(any(part in keyword for keyword in keywords) for part in term.split(" and "))
+
+
+def _overlapping(groups: Sequence[Sequence[str]]) -> List[str]:
+    """Filter terms of tests which are also selected by a term of another shard."""
+    overlapping = []
+    for i, group in enumerate(groups):
+        others = [term for j, other in enumerate(groups) if j != i for term in other]
+        for term in group:
+            keywords = term.split(" and ")
+            if any(_matches(other, keywords) for other in others):
+                overlapping.append(term)
+    return overlapping
+
+
+def _combine(expression: str, shard_expression: str) -> str:
+    if not expression.strip("'"):
+        return shard_expression
+    return f"({expression}) and ({shard_expression})"
+
+
+def _join_all(promises: Sequence[Any]) -> List[Any]:
+    """Join asynchronous commands, kill the remaining ones if one of them fails."""
+    results: List[Any] = []
+    try:
+        for promise in promises:
+            results.append(promise.join())
+    except Exception:
+        pending = promises[len(results) + 1 :]  # noqa
+        for promise in pending:
+            if not promise.runner.process_is_finished:
+                promise.runner.kill()
+        for promise in pending:
+            try:
+                promise.join()
+            except Exception as err:
+                log.info("Stopped command: %s", err)
+        raise
+    return results
+
 
 @attr.s
 class SmokeTestRunner:
@@ -31,67 +105,168 @@ class SmokeTestRunner:
     iqe_test_importance: str = attr.ib(default="'")
     iqe_plugins: str = attr.ib(default="'")
     artifacts_dir: str = attr.ib(default="'")
+    shards: int = attr.ib(default=1, converter=lambda x: int(x or 1))  # type: ignore
+    shard_by: str = attr.ib(default="plugin", validator=attr.validators.in_(SHARD_BY))
+    # marker expressions to split across shards with `shard_by="marker"`
+    shard_markers: List[str] = attr.ib(factory=list)
+    # test ids to split across shards with `shard_by="hash"` or `shard_by="duration"`,
+    # see `durations.test_keywords` for the supported formats
+    shard_tests: List[str] = attr.ib(factory=list)
+    # sqlite file with test durations of previous runs
+    duration_index: Optional[str] = attr.ib(default=None)
+
+    def _shard_options(self) -> List[Dict[str, str]]:
+        """Marker, filter and plugins of every CJI, a single CJI if not sharded."""
+        options = {
+            "marker": self.iqe_marker,
+            "filter": self.iqe_filter,
+            "plugins": self.iqe_plugins,
+        }
+        if self.shards <= 1:
+            return [options]
+        if self.shard_by == "plugin":
+            plugins = [x for x in self.iqe_plugins.strip("'").split(",") if x]
+            shards = [
+                {**options, "plugins": ",".join(group)}
+                for group in _distribute(plugins, self.shards)
+            ]
+        elif self.shard_by == "marker":
+            shards = [
+                {**options, "marker": _combine(self.iqe_marker, " or ".join(group))}
+                for group in _distribute(self.shard_markers, self.shards)
+            ]
+        else:
+            if self.shard_by == "duration":
+                groups = self._duration_shards()
+            else:
+                groups = _hash_partition(self.shard_tests, self.shards)
+            overlapping = _overlapping(groups)
+            if overlapping:
+                log.warning(
+                    "Tests selected by more than one shard, they run more than once: %s",
+                    ", ".join(overlapping),
+                )
+            shards = [
+                {**options, "filter": _combine(self.iqe_filter, " or ".join(group))}
+                for group in groups
+            ]
+        if not shards:
+            log.warning("Nothing to shard by '%s', running a single CJI", self.shard_by)
+        return shards or [options]
+
+    def _duration_shards(self) -> List[List[str]]:
+        """Shards of similar expected duration based on the duration index."""
+        if not self.duration_index:
+            raise FatalError(
+                "sharding by 'duration' requires a duration index, set IQE_DURATION_INDEX"
+            )
+        # the index only knows tests of previous runs, new tests would match no shard
+        if not self.shard_tests:
+            raise FatalError("sharding by 'duration' requires the test ids, set IQE_SHARD_TESTS")
+        index = DurationIndex(self.duration_index)
+        return index.balanced_shards(self.shards, self.shard_tests, key=filter_name)
 
-    def fetch_from_minio(self, pod) -> None:
+    def _merge_artifacts(self, shard_dir: Path, shard: str) -> None:
+        """Move artifacts of a shard to `artifacts_dir`, suffix file names with the shard."""
+        artifacts_path = Path(self.artifacts_dir)
+        for cur_file in sorted(shard_dir.rglob("*")):
+            if not cur_file.is_file():
+                continue
+            target = artifacts_path / cur_file.relative_to(shard_dir)
+            target = target.with_name(f"{target.stem}-{shard}{target.suffix}")
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.move(str(cur_file), target)
+        shutil.rmtree(shard_dir, ignore_errors=True)
+
+    @skip_on_dry_run()
+    def fetch_from_minio(self, *pods: str) -> None:
         # TODO: use python minio
-        mc_image = "quay.io/cloudservices/mc"
+        mc_image = MC_IMAGE
         minio_access, minio_secret_key, minio_host, minio_port = setup_minio(
             self.oc, self.docker, mc_image, self.namespace
         )
         if not (minio_access or minio_secret_key or minio_port):
             FatalError("Failed to fetch minio connection info when running 'oc' commands")
 
-        container_name = f"mc-{self.job_name}-{self.build_number}"
-        bucket_name = f"{pod}-artifacts"
-        cmd = f"""
-            mkdir -p /artifacts && \
-            mc --no-color --quiet alias set minio \
-            http://{minio_host}:{minio_port} {minio_access} {minio_secret_key} && \
-            mc --no-color --quiet mirror --overwrite minio/{bucket_name} /artifacts/
-        """
-        # Add retry logic for intermittent minio connection failures
-        exception = None
-        for _ in range(5):
-            try:
-                run_mc(self.docker, container_name, mc_image, cmd, self.artifacts_dir)
-                break
-            except Exception as err:
-                exception = err
-                log.warn("minio artifact copy failed, retrying in 5sec...")
-                sleep(5)
-        else:
-            raise FatalError(f"minio artifact copy failed - {exception}")
+        for pod in pods:
+            container_name = f"mc-{self.job_name}-{self.build_number}-{pod}"
+            bucket_name = f"{pod}-artifacts"
+            # artifacts of shards are fetched separately to be merged afterwards
+            target_dir = self.artifacts_dir if len(pods) == 1 else f"{self.artifacts_dir}/.{pod}"
+            cmd = f"""
+                mkdir -p /artifacts && \
+                mc --no-color --quiet alias set minio \
+                http://{minio_host}:{minio_port} {minio_access} {minio_secret_key} && \
+                mc --no-color --quiet mirror --overwrite minio/{bucket_name} /artifacts/
+            """
+            # Add retry logic for intermittent minio connection failures
+            exception = None
+            for _ in range(5):
+                try:
+                    run_mc(self.docker, container_name, mc_image, cmd, target_dir)
+                    break
+                except Exception as err:
+                    exception = err
+                    log.warn("minio artifact copy failed, retrying in 5sec...")
+                    sleep(5)
+            else:
+                raise FatalError(f"minio artifact copy failed - {exception}")
+            if len(pods) > 1:
+                self._merge_artifacts(Path(target_dir), pod)
 
         log.info("copied artifacts from iqe pod: ")
         artifacts_path = Path(self.artifacts_dir)
         for cur_file in artifacts_path.iterdir():
             log.info("%s", cur_file)
 
-    def deploy_iqe_cji(self):
-        pod = run(
-            f"""
-            bonfire deploy-iqe-cji {self.cji_name} \
-                --marker '{self.iqe_marker}' \
-                --filter '{self.iqe_filter}' \
-                --image-tag {self.iqe_image_tag} \
-                --requirements '{self.iqe_requirements}' \
-                --requirements-priority '{self.iqe_requirements_priority}' \
-                --test-importance '{self.iqe_test_importance}' \
-                --plugins '{self.iqe_plugins}' \
-                --env "clowder_smoke" \
-                --cji-name {self.cji_name} \
-                --namespace {self.namespace}
-            """,
-            echo=True,
-        ).stdout.strip("\n")
-
-        # Pipe logs to background to keep them rolling in jenkins
-        self.oc.logs(pod, "-f", namespace=self.namespace)
+    @skip_on_dry_run()
+    def summarize_results(self) -> Summary:
+        log.info("Summarizing junit results...")
+        index = DurationIndex(self.duration_index) if self.duration_index else None
+        summary = summarize(self.artifacts_dir, sinks=[index] if index else [])
+        if index:
+            index.flush()
+        return summary
+
+    def deploy_iqe_cji(self) -> Optional[Summary]:
+        shard_options = self._shard_options()
+        cji_names = [self.cji_name]
+        if len(shard_options) > 1:
+            cji_names = [f"{self.cji_name}-{i}" for i in range(len(shard_options))]
+
+        # deploy all CJIs at once, bonfire returns when the iqe pod is running
+        deployments = [
+            executor.run(
+                f"""
+                bonfire deploy-iqe-cji {self.cji_name} \
+                    --marker '{options["marker"]}' \
+                    --filter '{options["filter"]}' \
+                    --image-tag {self.iqe_image_tag} \
+                    --requirements '{self.iqe_requirements}' \
+                    --requirements-priority '{self.iqe_requirements_priority}' \
+                    --test-importance '{self.iqe_test_importance}' \
+                    --plugins '{options["plugins"]}' \
+                    --env "clowder_smoke" \
+                    --cji-name {cji_name} \
+                    --namespace {self.namespace}
+                """,
+                echo=True,
+                asynchronous=True,
+            )
+            for cji_name, options in zip(cji_names, shard_options)
+        ]
+        pods = [result.stdout.strip("\n") for result in _join_all(deployments)]
+
+        if len(pods) == 1:
+            # Pipe logs to background to keep them rolling in jenkins
+            self.oc.logs(pods[0], "-f", namespace=self.namespace)
+        else:
+            log.info("Running %d IQE shards in pods: %s", len(pods), ", ".join(pods))
 
         # Wait for the job to Complete or Fail before we try to grab artifacts
         # condition=complete does trigger when the job fails
         self.oc.wait(
-            f"cji/{self.cji_name}",
+            *[f"cji/{cji_name}" for cji_name in cji_names],
             "--for",
             "condition=JobInvocationComplete",
             timeout=self.cji_timeout,
@@ -99,4 +274,5 @@ class SmokeTestRunner:
         )
 
         log.info("Fetching artifacts from minio...")
-        self.fetch_from_minio(pod)
+        self.fetch_from_minio(*pods)
+        return self.summarize_results()
@@ -1,4 +1,4 @@
-import base64
+import io
 import json
 import logging
 import os
@@ -13,22 +13,49 @@ from typing import Tuple
 
 import attr
 from distutils.util import strtobool
-from invoke import run
 
+from .artifacts import ArtifactBundle
 from .clients.container import ContainerClient
+from .clients.executor import executor
+from .clients.executor import skip_on_dry_run
 from .clients.openshift import OpenshiftClient
+from .credentials import clear_cache
+from .credentials import CredentialsResolver
 
 logger = logging.getLogger(__name__)
 
 RELEASE_NAMESPACE = strtobool(os.getenv("RELEASE_NAMESPACE", "true"))
 K8S_ARTIFACTS_DIR = os.getenv("K8S_ARTIFACTS_DIR")
+ARTIFACTS_COMPRESSION = os.getenv("ARTIFACTS_COMPRESSION", "zstd")
 
 
-def _get_pod_logs(oc: OpenshiftClient, ns: str) -> None:
-    logs_dir = Path(f"{K8S_ARTIFACTS_DIR}/{ns}/logs")
-    logs_dir.mkdir(parents=True, exist_ok=True)
+def _timestamp_key(timestamp: str) -> str:
+    """Make RFC3339Nano timestamps with trimmed fractions comparable as strings."""
+    seconds, __, fraction = timestamp.rstrip("Z").partition(".")
+    return f"{seconds}.{fraction:0<9}"
+
+
+def _new_log_lines(data: bytes, since: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    """Drop lines of a `--timestamps` log stored before, return new lines and last timestamp."""
+    lines = []
+    last = since
+    for line in data.splitlines(keepends=True):
+        timestamp = line.split(b" ", 1)[0].decode(errors="ignore")
+        if not timestamp.endswith("Z"):
+            lines.append(line)
+            continue
+        if since and _timestamp_key(timestamp) <= _timestamp_key(since):
+            continue
+        lines.append(line)
+        last = timestamp
+    return b"".join(lines), last
+
+
+def _get_pod_logs(oc: OpenshiftClient, ns: str, bundle: ArtifactBundle) -> None:
     logger.info("Collecting container logs...")
-    pods_json = json.loads(oc.get.pods(namespace=ns, output="json", _silent=True).stdout)
+    pods_json = json.loads(
+        oc.get.pods(namespace=ns, output="json", _silent=True, _cache=False).stdout
+    )
     pods_containers: Dict[str, List[str]] = {}
     for item in pods_json["items"]:
         pod_name = item["metadata"]["name"]
@@ -40,42 +67,103 @@ def _get_pod_logs(oc: OpenshiftClient, ns: str) -> None:
 
     for pod, containers in pods_containers.items():
         for container in containers:
+            # fetch only lines logged after the checkpoint of the previous collection
+            log_path = f"logs/{pod}_{container}.log"
+            since = bundle.index.get(log_path, {}).get("since_time")
+            since_args = [f"--since-time={since}"] if since else []
             current = oc.logs(
-                pod, container=container, namespace=ns, _ignore_errors=True, _silent=True
+                pod,
+                "--timestamps",
+                *since_args,
+                container=container,
+                namespace=ns,
+                _ignore_errors=True,
+                _silent=True,
             )
             previous = oc.logs(
-                pod, container=container, namespace=ns, _ignore_errors=True, _silent=True
+                pod,
+                "--previous",
+                container=container,
+                namespace=ns,
+                _ignore_errors=True,
+                _silent=True,
             )
             if current:
-                with open(logs_dir / f"{pod}_{container}.log", "wb") as f:
-                    f.write(current.stdout)
+                data, last = _new_log_lines(current.stdout, since)
+                bundle.append(log_path, data, pod=pod, container=container, since_time=last)
+                # checkpoint every container, an interrupted collection must not
+                # leave appended lines behind a stale `since_time`
+                bundle.write_index(log_stats=False)
             if previous:
-                with open(logs_dir / f"{pod}_{container}-previous.log", "wb") as f:
-                    f.write(previous.stdout)
+                bundle.add(
+                    f"logs/{pod}_{container}-previous.log",
+                    previous.stdout,
+                    pod=pod,
+                    container=container,
+                    previous=True,
+                )
+
+
+def _get_bundle(ns: str) -> ArtifactBundle:
+    return ArtifactBundle(Path(f"{K8S_ARTIFACTS_DIR}/{ns}"), compression=ARTIFACTS_COMPRESSION)
+
+
+@skip_on_dry_run()
+def _prepare_artifacts_dir() -> None:
+    """Keep artifacts and log checkpoints of this run, drop leftovers of other runs.
+
+    Without JOB_NAME and BUILD_NUMBER runs can't be told apart, so nothing is kept.
+    """
+    artifacts_dir = Path(str(K8S_ARTIFACTS_DIR))
+    run_file = artifacts_dir / ".run"
+    job_name, build_number = os.getenv("JOB_NAME"), os.getenv("BUILD_NUMBER")
+    run_id = f"{job_name}-{build_number}" if job_name and build_number else ""
+    if run_id and run_file.exists() and run_file.read_text() == run_id:
+        return
+    shutil.rmtree(artifacts_dir, ignore_errors=True)
+    artifacts_dir.mkdir(parents=True, exist_ok=True)
+    if run_id:
+        run_file.write_text(run_id)
 
 
+@skip_on_dry_run()
+def snapshot_pod_logs(oc: OpenshiftClient, ns: str) -> None:
+    """Fetch container logs logged since the last collection, e.g. during long smoke runs."""
+    if not K8S_ARTIFACTS_DIR:
+        logger.warning("K8S_ARTIFACTS_DIR is not set, skipping log snapshot")
+        return
+    _prepare_artifacts_dir()
+    bundle = _get_bundle(ns)
+    try:
+        _get_pod_logs(oc, ns, bundle)
+    finally:
+        bundle.write_index()
+
+
+@skip_on_dry_run()
 def _collect_k8s_artifacts(oc: OpenshiftClient, ns: str) -> None:
-    ns_artifacts_dir = Path(f"{K8S_ARTIFACTS_DIR}/{ns}")
-    ns_artifacts_dir.mkdir(parents=True, exist_ok=True)
-    _get_pod_logs(oc, ns)
-    logger.info("Collecting events and k8s configs...")
-
-    events = oc.get.events(namespace=ns, sort_by=".lastTimestamp", _silent=True)
-    all = oc.get.all(namespace=ns, output="yaml", _silent=True)
-    clowdapp = oc.get.clowdapp(namespace=ns, output="yaml", _silent=True)
-    clowdenv = oc.get.clowdenvironment(f"env-{ns}", output="yaml", _silent=True)
-    cji = oc.get.clowdjobinvocation(namespace=ns, output="yaml", _silent=True)
-
-    logs = (
-        (ns_artifacts_dir / "oc_get_events.txt", events),
-        (ns_artifacts_dir / "oc_get_all.yaml", all),
-        (ns_artifacts_dir / "oc_get_clowdapp.yaml", clowdapp),
-        (ns_artifacts_dir / "oc_get_clowdenvironment.yaml", clowdenv),
-        (ns_artifacts_dir / "oc_get_clowdjobinvocation.yaml", cji),
-    )
-    for log in logs:
-        with open(log[0], "wb") as f:
-            f.write(log[1].stdout)
+    bundle = _get_bundle(ns)
+    try:
+        _get_pod_logs(oc, ns, bundle)
+        logger.info("Collecting events and k8s configs...")
+
+        events = oc.get.events(namespace=ns, sort_by=".lastTimestamp", _silent=True)
+        all = oc.get.all(namespace=ns, output="yaml", _silent=True)
+        clowdapp = oc.get.clowdapp(namespace=ns, output="yaml", _silent=True)
+        clowdenv = oc.get.clowdenvironment(f"env-{ns}", output="yaml", _silent=True)
+        cji = oc.get.clowdjobinvocation(namespace=ns, output="yaml", _silent=True)
+
+        logs = (
+            ("oc_get_events.txt", events),
+            ("oc_get_all.yaml", all),
+            ("oc_get_clowdapp.yaml", clowdapp),
+            ("oc_get_clowdenvironment.yaml", clowdenv),
+            ("oc_get_clowdjobinvocation.yaml", cji),
+        )
+        for log in logs:
+            bundle.add(log[0], log[1].stdout)
+    finally:
+        bundle.write_index()
 
 
 def teardown(oc: OpenshiftClient, namespace: Optional[str] = None) -> None:
@@ -83,7 +171,7 @@ def teardown(oc: OpenshiftClient, namespace: Optional[str] = None) -> None:
     logger.info("----- TEARING DOWN -----")
     logger.info("------------------------")
     if K8S_ARTIFACTS_DIR:
-        shutil.rmtree(K8S_ARTIFACTS_DIR, ignore_errors=True)
+        _prepare_artifacts_dir()
     namespace_env = os.getenv("NAMESPACE")
     db_namespace_env = os.getenv("DB_NAMESPACE")
     smoke_namespace_env = os.getenv("SMOKE_NAMESPACE")
@@ -98,7 +186,17 @@ def teardown(oc: OpenshiftClient, namespace: Optional[str] = None) -> None:
         finally:
             if RELEASE_NAMESPACE:
                 logger.info("Releasing namespace reservation")
-                run(f"bonfire namespace release {ns} -f")
+                executor.run(f"bonfire namespace release {ns} -f")
+            clear_cache(ns)
+
+
+def parse_size(size: str) -> int:
+    """Convert size like `20G` or `512M` to bytes."""
+    units = {"K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+    size = size.strip().upper().rstrip("B")
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
 
 
 def convert_arg(option_name: str, values: Optional[str] = None) -> str:
@@ -107,6 +205,11 @@ def convert_arg(option_name: str, values: Optional[str] = None) -> str:
     return " ".join([f"{option_name}={x}" for x in values.split(",")])
 
 
+def split_arg(arg: str) -> Tuple[str, ...]:
+    """Inverse of `convert_arg`, get the option values back."""
+    return tuple(x.split("=", 1)[1] for x in arg.split() if "=" in x)
+
+
 def set_port_forward(oc: OpenshiftClient, svc_name: str, port: str, ns: str) -> str:
     s = socket.socket()
     s.bind(("", 0))
@@ -115,9 +218,9 @@ def set_port_forward(oc: OpenshiftClient, svc_name: str, port: str, ns: str) ->
     port_forward_pid = oc.port_forward(
         f"svc/{svc_name}",
         f"{local_port}:{port}",
-        namespace={ns},
+        namespace=ns,
     ).pid
-    os.environ["PORT_FORWARD_PID"] = port_forward_pid
+    os.environ["PORT_FORWARD_PID"] = str(port_forward_pid)
     return str(local_port)
 
 
@@ -129,17 +232,14 @@ def setup_minio(
     docker.pull(mc_image)
     # Set up port-forward for minio
     svc_port = set_port_forward(oc, f"env-{ns}-minio", "9000", ns)
-    # Get the secret from the env
-    minio_secret = oc.get.secret(f"env-{ns}-minio", output="json", _silent=True)
-    secret_json = json.loads(minio_secret.stdout)
-    # Grab the needed creds from the secret
-    minio_access = base64.b64decode(secret_json["data"]["accessKey"])
-    minio_secret_key = base64.b64decode(secret_json["data"]["secretKey"])
+    # Grab the needed creds from the env secret
+    minio_creds = CredentialsResolver(oc, ns).minio_creds()
     minio_host = "localhost"
     minio_port = svc_port
-    return str(minio_access), str(minio_secret_key), minio_host, minio_port
+    return minio_creds["access_key"], minio_creds["secret_key"], minio_host, minio_port
 
 
+@skip_on_dry_run()
 def run_mc(
     docker: ContainerClient, container_name: str, mc_image: str, cmd: str, artifacts_dir: str
 ):
@@ -159,7 +259,7 @@ def run_mc(
     )
     container = docker.client.containers.get(container_name)
     stream, __ = container.get_archive("/artifacts/.")
-    with tarfile.open(stream.read(), "r") as tf:
+    with tarfile.open(fileobj=io.BytesIO(b"".join(stream)), mode="r") as tf:
         tf.extractall(path=artifacts_dir)
 
 